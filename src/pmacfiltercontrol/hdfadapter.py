@@ -1,11 +1,15 @@
 """HDF5 adapter for use in PMAC Filter Control."""
 
-import os
-from typing import Optional
+import queue
+import stat
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
 
 import h5py
-from numpy import int64 as np_int64
-from numpy import issubdtype
+import numpy as np
+import orjson
 
 ATTENUATION_KEY = "attenuation"
 ADJUSTMENT_KEY = "adjustment"
@@ -13,9 +17,29 @@ FRAME_NUMBER_KEY = "frame_number"
 UID_KEY = "uid"
 FILTERS_MOVING_FLAG_KEY = "filters_moving"
 
+DATASET_KEYS = (ADJUSTMENT_KEY, ATTENUATION_KEY, UID_KEY, FILTERS_MOVING_FLAG_KEY)
+
+# int64 * 1024 = 8 KiB per chunk, so a full buffer is written as exactly one chunk
+CHUNK_SIZE = 1024
+# Number of frames to buffer in memory before writing to the datasets
+BUFFER_SIZE = 1024
+# Raw data chunk cache settings, large enough to keep all active chunks resident
+CHUNK_CACHE_BYTES = 16 * 1024 * 1024
+CHUNK_CACHE_SLOTS = 10007
+CHUNK_CACHE_W0 = 1.0
+# Maximum time in seconds that a frame is buffered before being written
+FLUSH_PERIOD = 0.5
+
 
 class HDFAdapter:
-    """An adapter for HDF5 file writing."""
+    """An adapter for HDF5 file writing.
+
+    All file operations, including setting and checking the file path, are run in
+    order on a single writer thread, so that slow disk I/O does not block the caller.
+    set_file_path, open_file, close_file, write_frame and flush_if_due queue
+    operations for the writer thread and return immediately. The file state should
+    only be read or changed on the writer thread.
+    """
 
     def __init__(
         self,
@@ -31,12 +55,78 @@ class HDFAdapter:
         self.file: Optional[h5py.File] = None
         self.file_open: bool = False
 
+        self._dsets: Dict[str, h5py.Dataset] = {}
+        self._frames_written: int = 0
+
+        self._frame_buf = np.empty(BUFFER_SIZE, dtype=np.int64)
+        self._adjustment_buf = np.empty(BUFFER_SIZE, dtype=np.int64)
+        self._attenuation_buf = np.empty(BUFFER_SIZE, dtype=np.int64)
+        self._buf_count: int = 0
+        # Time the oldest buffered frame was received
+        self._first_buffered: float = 0.0
+        self._decode_error_logged: bool = False
+
+        self._writer_q: queue.Queue = queue.Queue()
+        self._writer_thread = threading.Thread(target=self._writer_loop, daemon=True)
+        self._writer_thread.start()
+
+    def set_file_path(self, new_file_path: str) -> None:
+        """Queue setting the HDF5 file path, if it is valid.
+
+        Args:
+            new_file_path (str): File path to set
+        """
+        self._writer_q.put_nowait((self._set_file_path, (new_file_path,)))
+
+    def open_file(self) -> None:
+        """Queue opening the HDF5 file."""
+        self._writer_q.put_nowait((self._open_file, ()))
+
+    def close_file(self) -> None:
+        """Queue closing the HDF5 file."""
+        self._writer_q.put_nowait((self._close_file, ()))
+
+    def write_frame(self, frame: bytes) -> None:
+        """Queue writing a frame event to the HDF5 file.
+
+        Args:
+            frame (bytes): Frame event received from the event stream
+        """
+        self._writer_q.put_nowait((self._write_frame, (frame,)))
+
+    def flush_if_due(self) -> None:
+        """Queue writing buffered frames if they have been buffered for too long."""
+        self._writer_q.put_nowait((self._flush_if_due, ()))
+
+    def stop(self) -> None:
+        """Close any open file and stop the writer thread once the queue is done."""
+        self.close_file()
+        self._writer_q.put_nowait(None)
+        self._writer_thread.join()
+
+    def _writer_loop(self) -> None:
+        """Run queued file operations until stopped."""
+        get = self._writer_q.get
+        while True:
+            item = get()
+            if item is None:
+                break
+            func, args = item
+            try:
+                func(*args)
+            except Exception as e:
+                print(f"* HDF5 writer error.\n{e}")
+
     def _set_file_path(self, new_file_path: str) -> None:
-        """Set HDF5 file path.
+        """Set HDF5 file path, unless it is already the current path.
+
+        A path that was rejected is checked again, e.g. once its directory exists.
 
         Args:
             new_file_path (str): File path to set
         """
+        if new_file_path == self.file_path:
+            return
         if self._check_path(new_file_path):
             self.file_path = new_file_path
 
@@ -44,7 +134,14 @@ class HDFAdapter:
         """Open a HDF5 file if one is not already open."""
         if self.file is None:
             if self._check_path(self.file_path):
-                self.file = h5py.File(self.file_path, "w", libver="latest")
+                self.file = h5py.File(
+                    self.file_path,
+                    "w",
+                    libver="latest",
+                    rdcc_nbytes=CHUNK_CACHE_BYTES,
+                    rdcc_nslots=CHUNK_CACHE_SLOTS,
+                    rdcc_w0=CHUNK_CACHE_W0,
+                )
                 print(f"* File {self.file} is open.")
                 self._setup_datasets()
                 self.file_open = True
@@ -57,6 +154,7 @@ class HDFAdapter:
         if self.file is not None:
             try:
                 assert isinstance(self.file, h5py.File)
+                self._flush_buffer()
                 print(f"* File {self.file} has been closed.")
                 self.file.close()
                 self.file = None
@@ -65,17 +163,30 @@ class HDFAdapter:
                 print(f"* Failed closing file.\n{e}")
 
     def _check_path(self, file_path: str) -> bool:
-        """Check that the provided file path is valid."""
+        """Check that the provided file path is a new file in an existing directory.
+
+        Relative paths are rejected, as they would depend on the working directory
+        of the IOC.
+        """
         if file_path == "" or file_path is None:
-            print(f"* Please enter a valid file path.\nPath={self.file_path}")
+            print(f"* Please enter a valid file path.\nPath={file_path}")
+        elif not Path(file_path).is_absolute():
+            print(f"* Please enter an absolute file path.\nPath={file_path}")
         else:
-            parent_path: str = file_path.rsplit("/", 1)[0]
-            if not os.path.isdir(parent_path):
+            path = Path(file_path)
+            try:
+                path_stat = path.stat()
+            except FileNotFoundError:
+                if path.parent.is_dir():
+                    return True
+                print("* Path not found. Enter a valid path.")
+            except OSError:
                 print("* Path not found. Enter a valid path.")
-            elif os.path.isfile(file_path):
-                print("* File already exists.")
             else:
-                return True
+                if stat.S_ISDIR(path_stat.st_mode):
+                    print("* Path is a directory. Enter a file name.")
+                else:
+                    print("* File already exists.")
 
         return False
 
@@ -87,37 +198,104 @@ class HDFAdapter:
             dset: h5py.Dataset = None
 
             assert isinstance(self.file, h5py.File)
-            dset = self.file.create_dataset(key, (1,), maxshape=(None,), dtype=int)
+            dset = self.file.create_dataset(
+                key, (0,), maxshape=(None,), chunks=(CHUNK_SIZE,), dtype=np.int64
+            )
 
             return dset
 
-        self.adjustment_dset = _create_dataset(ADJUSTMENT_KEY)
-        self.attenuation_dset = _create_dataset(ATTENUATION_KEY)
-        self.uid_dataset = _create_dataset(UID_KEY)
-        self.filters_moving_flag_dataset = _create_dataset(FILTERS_MOVING_FLAG_KEY)
+        self._dsets = {key: _create_dataset(key) for key in DATASET_KEYS}
+        self.adjustment_dset = self._dsets[ADJUSTMENT_KEY]
+        self.attenuation_dset = self._dsets[ATTENUATION_KEY]
+        self.uid_dataset = self._dsets[UID_KEY]
+        self.filters_moving_flag_dataset = self._dsets[FILTERS_MOVING_FLAG_KEY]
+
+        self._frames_written = 0
+        self._buf_count = 0
 
         assert isinstance(self.file, h5py.File)
         self.file.swmr_mode = True
 
+    def _write_frame(self, frame: bytes) -> None:
+        """Decode a frame event and write it to file if a file is open.
+
+        Args:
+            frame (bytes): Frame event received from the event stream
+        """
+        if not self.file_open:
+            print("WARNING: HDF5 file not open and frame received.")
+            return
+
+        try:
+            self._write_to_file(orjson.loads(frame))
+        except orjson.JSONDecodeError as e:
+            if not self._decode_error_logged:
+                print(f"WARNING: Invalid frame event received.\n{e}")
+                self._decode_error_logged = True
+        except RuntimeError as e:
+            print(e)
+
     def _write_to_file(self, data) -> None:
-        dset_size = self.adjustment_dset.size
-        assert issubdtype(dset_size, np_int64)
-        if data[FRAME_NUMBER_KEY] >= dset_size:
-            dset_size = max(data[FRAME_NUMBER_KEY], dset_size + 1)
-            self.adjustment_dset.resize((dset_size,))
-            self.attenuation_dset.resize((dset_size,))
-            self.uid_dataset.resize((dset_size,))
-            self.filters_moving_flag_dataset.resize((dset_size,))
-
-        self.adjustment_dset[data[FRAME_NUMBER_KEY]] = data[ADJUSTMENT_KEY]
-        self.attenuation_dset[data[FRAME_NUMBER_KEY]] = data[ATTENUATION_KEY]
-        self.uid_dataset[data[FRAME_NUMBER_KEY]] = int(data[FRAME_NUMBER_KEY]) + 1
-        filters_moving = (data[ADJUSTMENT_KEY] < 0 and data[ATTENUATION_KEY] > 0) or (
-            data[ADJUSTMENT_KEY] > 0 and data[ATTENUATION_KEY] < 15
-        )
-        self.filters_moving_flag_dataset[data[FRAME_NUMBER_KEY]] = filters_moving
-
-        self.adjustment_dset.flush()
-        self.attenuation_dset.flush()
-        self.uid_dataset.flush()
-        self.filters_moving_flag_dataset.flush()
+        """Buffer a frame of data, writing to file once the buffer is full.
+
+        The buffer is also written if its oldest frame has been buffered for longer
+        than FLUSH_PERIOD, so that readers see frames promptly while streaming.
+
+        Args:
+            data: Frame dictionary received from the event stream
+        """
+        idx = self._buf_count
+        self._frame_buf[idx] = data[FRAME_NUMBER_KEY]
+        self._adjustment_buf[idx] = data[ADJUSTMENT_KEY]
+        self._attenuation_buf[idx] = data[ATTENUATION_KEY]
+        self._buf_count = idx + 1
+
+        now = time.monotonic()
+        if idx == 0:
+            self._first_buffered = now
+        if self._buf_count == BUFFER_SIZE or now - self._first_buffered >= FLUSH_PERIOD:
+            self._flush_buffer()
+
+    def _flush_if_due(self) -> None:
+        """Write buffered frames if the oldest has been buffered for too long."""
+        if not self.file_open or self._buf_count == 0:
+            return
+        if time.monotonic() - self._first_buffered >= FLUSH_PERIOD:
+            self._flush_buffer()
+
+    def _flush_buffer(self) -> None:
+        """Write any buffered frames to the datasets and flush them to disk."""
+        count = self._buf_count
+        if count == 0:
+            return
+        self._buf_count = 0
+
+        frames = self._frame_buf[:count]
+        adjustment = self._adjustment_buf[:count]
+        attenuation = self._attenuation_buf[:count]
+        values: Dict[str, np.ndarray] = {
+            ADJUSTMENT_KEY: adjustment,
+            ATTENUATION_KEY: attenuation,
+            UID_KEY: frames + 1,
+            FILTERS_MOVING_FLAG_KEY: (
+                ((adjustment < 0) & (attenuation > 0))
+                | ((adjustment > 0) & (attenuation < 15))
+            ).astype(np.int64),
+        }
+
+        hi = int(frames.max()) + 1
+        if hi > self._frames_written:
+            # Only grow to the frames received, so SWMR readers never see padding
+            self._frames_written = hi
+            for dset in self._dsets.values():
+                dset.resize((hi,))
+
+        lo = int(frames[0])
+        contiguous = hi - lo == count and bool(np.all(np.diff(frames) == 1))
+        for key, dset in self._dsets.items():
+            if contiguous:
+                dset[lo:hi] = values[key]
+            else:
+                for frame, value in zip(frames, values[key]):
+                    dset[frame] = value
+            dset.flush()
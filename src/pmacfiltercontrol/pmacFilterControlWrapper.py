@@ -1,12 +1,18 @@
 """The PMAC Filter Control wrapper."""
 
 import asyncio
-import codecs
-import json
-from datetime import datetime as dt
+import atexit
+import os
+import queue
+import threading
+import time
+from enum import IntEnum
+from functools import wraps
 from pathlib import Path
-from typing import Callable, Dict, Union
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
+import numpy as np
+import orjson
 import zmq
 from aioca import caget, caput
 from softioc import builder
@@ -15,42 +21,114 @@ from softioc.builder import records
 from .hdfadapter import HDFAdapter
 from .zmqadapter import ZeroMQAdapter
 
-MODE = [
-    "MANUAL",
-    "CONTINUOUS",
-    "SINGLESHOT",
-]
 
-FILTER_SET = [
+class Mode(IntEnum):
+    """Control mode of the PowerBrick program."""
+
+    MANUAL = 0
+    CONTINUOUS = 1
+    SINGLESHOT = 2
+
+
+class State(IntEnum):
+    """State of the PowerBrick program, as shown on the STATE record."""
+
+    IDLE = 0
+    WAITING = 1
+    ACTIVE = 2
+    SINGLESHOT_WAITING = 3
+    SINGLESHOT_COMPLETE = 4
+    HIGH3_TRIGGERED = 14
+    TIMEOUT = 15
+
+
+MODE = tuple(mode.name for mode in Mode)
+
+FILTER_SET = (
     "Cu",
     "Mo 1",
     "Mo 2",
     "Mo 3",
     "Ag 1",
     "Ag 2",
-]
-
-ATTENUATION = [
-    0,
-    1,
-    2,
-    3,
-    4,
-    5,
-    6,
-    7,
-    8,
-    9,
-    10,
-    11,
-    12,
-    13,
-    14,
-    15,
-]
+)
+
+ATTENUATION = tuple(range(16))
 
 SHUTTER_CLOSED = "CLOSED"
 SHUTTER_OPEN = "OPEN"
+# Shutter states indexed by SHUTTER:POS record value
+SHUTTER_STATES = (SHUTTER_CLOSED, SHUTTER_OPEN)
+
+# Odin histogram thresholds
+HIST_THRESHOLDS = ("High3", "High2", "High1", "Low2", "Low1")
+
+# Pixel threshold record names and their keys in the pixel count thresholds
+PIXEL_THRESHOLDS = (
+    ("HIGH:THRESHOLD:EXTREME", "high3"),
+    ("HIGH:THRESHOLD:UPPER", "high2"),
+    ("HIGH:THRESHOLD:LOWER", "high1"),
+    ("LOW:THRESHOLD:UPPER", "low2"),
+    ("LOW:THRESHOLD:LOWER", "low1"),
+)
+
+STATUS_KEY = "status"
+# First byte of a JSON object ("{"), used to reject other messages before parsing
+_JSON_OBJECT_START = 0x7B
+
+_CMD_STATUS = b'{"command":"status"}'
+_CMD_RESET = b'{"command":"reset"}'
+_CMD_CLEAR_ERROR = b'{"command":"clear_error"}'
+_CMD_SINGLESHOT = b'{"command":"singleshot"}'
+# Configure command for a single integer parameter, e.g. mode or attenuation
+_CMD_CONFIGURE_INT = b'{"command":"configure","params":{"%b":%d}}'
+
+# Configure parameters that only store a setting, so are not resent if unchanged.
+# Mode and attenuation also change the program state, so they are always sent.
+_CACHED_CONFIG_KEYS = frozenset(
+    (
+        "in_positions",
+        "out_positions",
+        "shutter_closed_position",
+        "pixel_count_thresholds",
+        "timeout",
+    )
+)
+
+_NOT_CONNECTED_MSG = "Not connected to device. Try again once connection resumed."
+
+
+def _state_record_value(state: int) -> int:
+    """
+    Convert a PowerBrick program state to the value shown on the STATE record.
+
+    Args:
+        state (int): State from the PowerBrick program status
+
+    Returns:
+        int: STATE record value, with negative states offset by 16
+    """
+    return state + 16 if state < 0 else state
+
+
+def install_uvloop() -> bool:
+    """
+    Use the uvloop event loop policy, if uvloop is installed.
+
+    The IOC script must call this before creating the softioc AsyncioDispatcher, as
+    the dispatcher creates the event loop that the wrapper runs on. uvloop is
+    installed with the 'fast' extra.
+
+    Returns:
+        bool: True if the uvloop event loop policy is now in use.
+    """
+    try:
+        import uvloop
+    except ImportError:
+        return False
+
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return True
 
 
 def _if_connected(func: Callable) -> Callable:
@@ -67,12 +145,12 @@ def _if_connected(func: Callable) -> Callable:
         Callable: The function to wrap func in.
     """
 
-    def check_connection(*args, **kwargs) -> Union[Callable, bool]:
-        self = args[0]
+    @wraps(func)
+    def check_connection(self, *args, **kwargs) -> Union[Callable, bool]:
         if not self.connected:
-            print("Not connected to device. Try again once connection resumed.")
+            print(_NOT_CONNECTED_MSG)
             return True
-        return func(*args, *kwargs)
+        return func(self, *args, **kwargs)
 
     return check_connection
 
@@ -86,6 +164,9 @@ class Wrapper:
 
     POLL_PERIOD = 0.1
     RETRY_PERIOD = 5
+    CONFIG_DEBOUNCE = 0.01
+    AUTOSAVE_PERIOD = 0.5
+    ZMQ_IO_THREADS = 4
 
     def __init__(
         self,
@@ -119,18 +200,30 @@ class Wrapper:
         """
         self.ip = ip
         self.port = port
-        self.zmq_stream = ZeroMQAdapter(ip, port)
-        self.event_stream = ZeroMQAdapter(ip, event_stream_port, zmq_type=zmq.SUB)
+        self.zmq_stream = ZeroMQAdapter(ip, port, io_threads=self.ZMQ_IO_THREADS)
+        self.event_stream = ZeroMQAdapter(
+            ip,
+            event_stream_port,
+            zmq_type=zmq.SUB,
+            on_recv=self._handle_event,
+            io_threads=self.ZMQ_IO_THREADS,
+        )
 
         self.detector: str = detector
         self.motors: str = motors
 
         self.autosave_file: Path = Path(autosave_file_path)
 
-        self.status_recv: bool = True
+        self.status_recv: asyncio.Event = asyncio.Event()
+        self.status_recv.set()
         self.connected: bool = False
+        self._decode_error_logged: bool = False
 
         self.h5f: HDFAdapter = HDFAdapter(hdf_file_path)
+        atexit.register(self.h5f.stop)
+
+        self._pending_config: Dict[str, Union[int, float, Dict[str, int]]] = {}
+        self._config_flush_handle: Optional[asyncio.TimerHandle] = None
 
         self.pixel_count_thresholds = {
             "high1": 2,
@@ -139,6 +232,13 @@ class Wrapper:
             "low1": 2,
             "low2": 2,
         }
+        self._threshold_params: Dict[str, Union[int, float, Dict[str, int]]] = {
+            "pixel_count_thresholds": self.pixel_count_thresholds
+        }
+        self._configure_msg: Dict[str, object] = {"command": "configure", "params": {}}
+        # Values of _CACHED_CONFIG_KEYS last sent to the PowerBrick program, reset on
+        # (re)connection
+        self._configured_cache: Dict[str, Any] = {}
 
         self.device_name = device_name
 
@@ -163,6 +263,8 @@ class Wrapper:
         )
         self.state.add_metadata("archiver 1 Monitor")
 
+        # Mode last sent to the PowerBrick program
+        self._mode: int = Mode.MANUAL
         self.mode = builder.mbbOut(
             "MODE",
             *MODE,
@@ -179,10 +281,13 @@ class Wrapper:
             OOPT="When Zero",
         )
 
+        self._timeout: float = 3
         self.timeout = builder.aOut(
-            "TIMEOUT", initial_value=3, on_update=self._set_timeout
+            "TIMEOUT", initial_value=self._timeout, on_update=self._set_timeout
+        )
+        self.timeout_rbv = builder.aIn(
+            "TIMEOUT_RBV", initial_value=self._timeout, EGU="s"
         )
-        self.timeout_rbv = builder.aIn("TIMEOUT_RBV", initial_value=3, EGU="s")
 
         self.clear_error = builder.boolOut("ERROR:CLEAR", on_update=self._clear_error)
         self._reset_error = records.calcout(
@@ -211,12 +316,15 @@ class Wrapper:
             "FILTER_SET_RBV", *FILTER_SET, initial_value=0
         )
 
+        self._file_path: str = f"{hdf_file_path}"
+        self._file_name: str = "attenuation.h5"
+
         self.file_path = builder.longStringOut(
             "FILE:PATH",
             on_update=self._set_file_path,
             FTVL="UCHAR",
             length=256,
-            initial_value=f"{hdf_file_path}",
+            initial_value=self._file_path,
         )
         self.file_path_rbv = builder.longStringIn(
             "FILE:PATH_RBV",
@@ -228,7 +336,7 @@ class Wrapper:
             on_update=self._set_file_name,
             FTVL="UCHAR",
             length=256,
-            initial_value="attenuation.h5",
+            initial_value=self._file_name,
         )
         self.file_name_rbv = builder.longStringIn(
             "FILE:NAME_RBV",
@@ -261,8 +369,24 @@ class Wrapper:
             "ATTENUATION", *ATTENUATION, on_update=self._set_manual_attenuation
         )
 
+        # Status keys, the records they are shown on and any conversion required
+        self._status_records: List[Tuple[str, Any, Optional[Callable[[int], Any]]]] = [
+            ("state", self.state, _state_record_value),
+            ("version", self.version, str),
+            ("process_duration", self.process_duration, None),
+            ("process_period", self.process_period, None),
+            ("last_received_frame", self.last_frame_received, None),
+            ("last_processed_frame", self.last_frame_processed, None),
+            ("time_since_last_message", self.time_since_last_frame, None),
+            ("current_attenuation", self.current_attenuation, None),
+        ]
+
+        # Odin histogram threshold PVs, by threshold
+        self._hist_pv: Dict[str, str] = {
+            key: f"{self.detector}:OD:SUM:Histogram:{key}" for key in HIST_THRESHOLDS
+        }
         self._hist_thresholds: Dict[str, builder.aOut] = {}
-        for threshold in ("High3", "High2", "High1", "Low2", "Low1"):
+        for threshold in HIST_THRESHOLDS:
             hist = builder.aOut(
                 f"HIST:{threshold.upper()}",
                 on_update=lambda val, threshold=threshold: self._set_hist(
@@ -279,8 +403,26 @@ class Wrapper:
         )
 
         self._autosave_dict: Dict[str, float] = {}
+        # Contents last queued for the writer thread, cleared if a write fails
+        self._queued_autosave: Optional[str] = None
+        self._autosave_stopped: bool = False
+        # Queueing can happen on the event loop and on the atexit thread
+        self._autosave_lock = threading.Lock()
+        # Hourly backup file, only rebuilt when the hour changes
+        self._autosave_hour: str = ""
+        self.autosave_backup_file: Optional[Path] = None
+        self._autosave_dirty: asyncio.Event = asyncio.Event()
+        self._filter_set_autosave_key: str = f"{self.device_name}:FILTER_SET"
+        # Only the newest contents are kept if the writer falls behind
+        self._autosave_q: queue.Queue = queue.Queue(maxsize=1)
+        self._autosave_thread = threading.Thread(
+            target=self._autosave_writer, daemon=True
+        )
+        self._autosave_thread.start()
+        atexit.register(self.stop_autosave)
 
-        if self.autosave_file.exists():
+        self._autosave_exists: bool = self.autosave_file.exists()
+        if self._autosave_exists:
             print("--- Autosave exists, restoring ---")
             self._autosave_dict = self._get_autosave()
 
@@ -302,10 +444,11 @@ class Wrapper:
         self._configure_param(
             {"shutter_closed_position": self.shutter_pos_closed.get()}
         )
+        self._set_thresholds()
 
-        if f"{self.device_name}:FILTER_SET" in self._autosave_dict.keys():
+        if self._filter_set_autosave_key in self._autosave_dict:
             autosaved_filter_set: int = int(
-                self._autosave_dict[f"{self.device_name}:FILTER_SET"]
+                self._autosave_dict[self._filter_set_autosave_key]
             )
             print(f"~ Restoring with filter set: {FILTER_SET[autosaved_filter_set]}")
             self.filter_set.set(autosaved_filter_set, process=False)
@@ -330,29 +473,104 @@ class Wrapper:
         autosave_dict = {}
         with self.autosave_file.open("r") as autosave_file:
             for line in autosave_file:
-                line_ = line.strip().split(" ")
-                autosave_dict[line_[0]] = float(line_[1])
+                key, sep, value = line.rstrip("\n").partition(" ")
+                if sep:
+                    autosave_dict[key] = float(value)
         return autosave_dict
 
     def write_autosave(self) -> None:
         """
-        Write to autosave files.
+        Queue writing to autosave files.
+
+        Queue the current autosave dictionary to be written to the autosave files by
+        the autosave writer thread, with a ' ' delimiter between key/value and each
+        separated by a newline. Nothing is queued if the contents are unchanged since
+        they were last queued, or once the writer has been stopped. If a previous
+        write is still queued it is replaced.
+        """
+        with self._autosave_lock:
+            if not self._autosave_stopped:
+                self._queue_autosave()
+
+    def stop_autosave(self) -> None:
+        """
+        Write any autosave changes and stop the writer thread once it is done.
+
+        This is registered with atexit, so may be called from a different thread to
+        the event loop. Once stopped, nothing more is queued, so a write from the
+        event loop cannot replace the final contents.
+        """
+        with self._autosave_lock:
+            if self._autosave_stopped:
+                return
+            self._queue_autosave()
+            self._autosave_stopped = True
+
+        self._autosave_q.put(None)
+        self._autosave_thread.join()
+
+    def _queue_autosave(self) -> None:
+        """Queue the autosave contents if changed. Must hold _autosave_lock."""
+        autosave = self._format_autosave()
+        if autosave == self._queued_autosave:
+            return
+        self._queued_autosave = autosave
+
+        try:
+            self._autosave_q.put_nowait(autosave)
+        except queue.Full:
+            try:
+                self._autosave_q.get_nowait()
+            except queue.Empty:
+                pass
+            self._autosave_q.put_nowait(autosave)
+
+    def _autosave_writer(self) -> None:
+        """Write queued autosave contents until stopped."""
+        get = self._autosave_q.get
+        while True:
+            autosave = get()
+            if autosave is None:
+                break
+            try:
+                self._write_autosave_files(autosave)
+            except Exception as e:
+                # Allow the same contents to be queued again
+                self._queued_autosave = None
+                print(f"* Autosave writer error.\n{e}")
 
-        Write the current autosave dictionary to the autosave files, with a
-        ' ' delimiter between key/value and each separated by a newline.
+    def _format_autosave(self) -> str:
         """
-        parent_dir = self.autosave_file.parent
-        self.autosave_datetime: dt = dt.now()
-        self.autosave_backup_file: Path = parent_dir.joinpath(
-            f"autosave-{self.autosave_datetime:%Y%m%d-%H}.txt"
-        )
+        Format the autosave dictionary as the contents of an autosave file.
 
-        for autosave_file in [self.autosave_file, self.autosave_backup_file]:
-            autosave_file.write_text(
-                "\n".join(
-                    f"{key} {value}" for key, value in self._autosave_dict.items()
-                )
+        The dictionary is copied first, as it may be updated on the event loop while
+        being formatted on another thread.
+        """
+        autosave_dict = self._autosave_dict.copy()
+        return "\n".join(f"{key} {value}" for key, value in autosave_dict.items())
+
+    def _write_autosave_files(self, autosave: str) -> None:
+        """
+        Write the given contents to the autosave and hourly backup files.
+
+        Each file is written to a temporary file first and then swapped into place.
+        This is only called from the autosave writer thread.
+
+        Args:
+            autosave (str): Formatted autosave file contents
+        """
+        hour = time.strftime("%Y%m%d-%H")
+        if hour != self._autosave_hour:
+            self.autosave_backup_file = self.autosave_file.parent.joinpath(
+                f"autosave-{hour}.txt"
             )
+            self._autosave_hour = hour
+        assert self.autosave_backup_file is not None
+
+        for autosave_file in [self.autosave_file, self.autosave_backup_file]:
+            tmp_file = autosave_file.with_name(f"{autosave_file.name}.tmp")
+            tmp_file.write_text(autosave)
+            os.replace(tmp_file, autosave_file)
 
             print(f"Updated {autosave_file.name} with new positions.")
 
@@ -371,50 +589,51 @@ class Wrapper:
             filter_set_total (int): The number of filter sets
             filters_per_set (int): The number of filters per filter set
         """
-        self.filter_sets_in: Dict[str, Dict[str, builder.aOut]] = {}
-        self.filter_sets_out: Dict[str, Dict[str, builder.aOut]] = {}
-
-        for i in range(1, filter_set_total + 1):
-            filter_set_key = f"filter_set_{i}"
-            self.filter_sets_in[filter_set_key] = {}
-            self.filter_sets_out[filter_set_key] = {}
-
-            for j in range(1, filters_per_set + 1):
-                IN_KEY = f"FILTER_SET:{i}:IN:{j}"
-                OUT_KEY = f"FILTER_SET:{i}:OUT:{j}"
-
-                in_value: float = (
-                    self._autosave_dict[f"{self.device_name}:{IN_KEY}"]
-                    if self.autosave_file.exists()
-                    else 100.0
-                )
-                in_record: builder.aOut = builder.aOut(
-                    IN_KEY,
-                    initial_value=in_value,
-                    on_update=lambda val, i=i, in_key=IN_KEY: self._set_pos(
-                        i, in_key, val
-                    ),
-                )
-
-                out_value: float = (
-                    self._autosave_dict[f"{self.device_name}:{OUT_KEY}"]
-                    if self.autosave_file.exists()
-                    else 0.0
-                )
-                out_record: builder.aOut = builder.aOut(
-                    OUT_KEY,
-                    initial_value=out_value,
-                    on_update=lambda val, i=i, out_key=OUT_KEY: self._set_pos(
-                        i, out_key, val
-                    ),
-                )
+        # Records indexed by (filter set - 1) * filters_per_set + (filter - 1)
+        self.filter_in_records: List[builder.aOut] = []
+        self.filter_out_records: List[builder.aOut] = []
+        # Position keys of each filter in the configure params
+        self._filter_keys: Tuple[str, ...] = tuple(
+            f"filter{j}" for j in range(1, filters_per_set + 1)
+        )
+        # Current positions, indexed by [filter set - 1, filter - 1]
+        self._in_positions = np.zeros((filter_set_total, filters_per_set))
+        self._out_positions = np.zeros((filter_set_total, filters_per_set))
+
+        autosave = self._autosave_dict
+        device_name = self.device_name
+        entries = [
+            (i, j, f"FILTER_SET:{i}:IN:{j}", f"FILTER_SET:{i}:OUT:{j}")
+            for i in range(1, filter_set_total + 1)
+            for j in range(1, filters_per_set + 1)
+        ]
 
-                if not self.autosave_file.exists():
-                    self._autosave_dict[in_record.name] = in_value
-                    self._autosave_dict[out_record.name] = out_value
+        for i, j, in_key, out_key in entries:
+            in_autosave_key = f"{device_name}:{in_key}"
+            out_autosave_key = f"{device_name}:{out_key}"
+            # Missing entries (e.g. no autosave file) are added with default values
+            in_value: float = autosave.setdefault(in_autosave_key, 100.0)
+            out_value: float = autosave.setdefault(out_autosave_key, 0.0)
+
+            in_record: builder.aOut = builder.aOut(
+                in_key,
+                initial_value=in_value,
+                on_update=lambda val, i=i, j=j, key=in_autosave_key: self._update_pos(
+                    self._in_positions, i, j, key, val
+                ),
+            )
+            out_record: builder.aOut = builder.aOut(
+                out_key,
+                initial_value=out_value,
+                on_update=lambda val, i=i, j=j, key=out_autosave_key: self._update_pos(
+                    self._out_positions, i, j, key, val
+                ),
+            )
 
-                self.filter_sets_in[filter_set_key][IN_KEY] = in_record
-                self.filter_sets_out[filter_set_key][OUT_KEY] = out_record
+            self._in_positions[i - 1, j - 1] = in_value
+            self._out_positions[i - 1, j - 1] = out_value
+            self.filter_in_records.append(in_record)
+            self.filter_out_records.append(out_record)
 
     def _generate_shutter_records(self) -> None:
         """
@@ -426,15 +645,15 @@ class Wrapper:
             "SHUTTER:POS", on_update=self._set_shutter, ZNAM="CLOSED", ONAM="OPEN"
         )
 
-        shutter_open_pos = (
-            self._autosave_dict[f"{self.device_name}:SHUTTER:OPEN"]
-            if self.autosave_file.exists()
-            else 0
-        )
+        self._shutter_autosave_keys: Dict[str, str] = {
+            state: f"{self.device_name}:SHUTTER:{state}" for state in SHUTTER_STATES
+        }
+        open_key = self._shutter_autosave_keys[SHUTTER_OPEN]
+        closed_key = self._shutter_autosave_keys[SHUTTER_CLOSED]
+
+        shutter_open_pos = self._autosave_dict[open_key] if self._autosave_exists else 0
         shutter_closed_pos = (
-            self._autosave_dict[f"{self.device_name}:SHUTTER:CLOSED"]
-            if self.autosave_file.exists()
-            else 500
+            self._autosave_dict[closed_key] if self._autosave_exists else 500
         )
 
         self.shutter_pos_open = builder.aOut(
@@ -448,55 +667,38 @@ class Wrapper:
             on_update=lambda val: self._set_shutter_pos(val, SHUTTER_CLOSED),
         )
 
-        if not self.autosave_file.exists():
-            self._autosave_dict[f"{self.device_name}:SHUTTER:OPEN"] = 0.0
-            self._autosave_dict[f"{self.device_name}:SHUTTER:CLOSED"] = 500.0
+        if not self._autosave_exists:
+            self._autosave_dict[open_key] = 0.0
+            self._autosave_dict[closed_key] = 500.0
 
     def _generate_pixel_threshold_records(self) -> None:
         """
         Generate pixel threshold records.
 
-        Generate records associated with the pixel threshold values.
-        """
-        self.extreme_high_threshold = builder.aOut(
-            "HIGH:THRESHOLD:EXTREME",
-            initial_value=100,
-            on_update=self._set_extreme_high_threshold,
-        )
-        self.upper_high_threshold = builder.aOut(
-            "HIGH:THRESHOLD:UPPER",
-            initial_value=2,
-            on_update=self._set_upper_high_threshold,
-        )
-        self.lower_high_threshold = builder.aOut(
-            "HIGH:THRESHOLD:LOWER",
-            initial_value=2,
-            on_update=self._set_lower_high_threshold,
-        )
-        self.upper_low_threshold = builder.aOut(
-            "LOW:THRESHOLD:UPPER",
-            initial_value=2,
-            on_update=self._set_upper_low_threshold,
-        )
-        self.lower_low_threshold = builder.aOut(
-            "LOW:THRESHOLD:LOWER",
-            initial_value=2,
-            on_update=self._set_lower_low_threshold,
-        )
-
-        pixel_threshold_records = [
-            self.extreme_high_threshold,
-            self.upper_high_threshold,
-            self.lower_high_threshold,
-            self.upper_low_threshold,
-            self.lower_low_threshold,
-        ]
+        Generate records associated with the pixel threshold values. Autosaved
+        values are restored without processing the records, and are sent to the
+        PowerBrick program together in the initial config.
+        """
+        self.pixel_threshold_records: Dict[str, builder.aOut] = {}
+        # Autosave keys of the pixel threshold records, by threshold key
+        self._pixel_threshold_autosave_keys: Dict[str, str] = {}
+        for record_name, key in PIXEL_THRESHOLDS:
+            autosave_key = f"{self.device_name}:{record_name}"
+            self._pixel_threshold_autosave_keys[key] = autosave_key
+            # Missing entries (e.g. no autosave file) are added with default values
+            value = int(
+                self._autosave_dict.setdefault(
+                    autosave_key, self.pixel_count_thresholds[key]
+                )
+            )
+            self.pixel_count_thresholds[key] = value
 
-        for record in pixel_threshold_records:
-            if not self.autosave_file.exists():
-                self._autosave_dict[record.name] = record.get()
-            else:
-                record.set(self._autosave_dict[record.name])
+            record = builder.aOut(
+                record_name,
+                initial_value=value,
+                on_update=lambda val, key=key: self._set_pixel_threshold(key, val),
+            )
+            self.pixel_threshold_records[key] = record
 
     async def _setup_hist_thresholds(self) -> None:
         """
@@ -505,59 +707,39 @@ class Wrapper:
         Setup the values for the histogram thresholds based on Odin records if no
         autosave exists.
         """
-        self._hist_threshold_values: Dict[str, float] = {
-            "High3": self._autosave_dict["High3"]
-            if "High3" in self._autosave_dict.keys()
-            else await caget(f"{self.detector}:OD:SUM:Histogram:High3"),
-            "High2": int(self._autosave_dict["High2"])
-            if "High2" in self._autosave_dict.keys()
-            else await caget(f"{self.detector}:OD:SUM:Histogram:High2"),
-            "High1": int(self._autosave_dict["High1"])
-            if "High1" in self._autosave_dict.keys()
-            else await caget(f"{self.detector}:OD:SUM:Histogram:High1"),
-            "Low1": int(self._autosave_dict["Low1"])
-            if "Low1" in self._autosave_dict.keys()
-            else await caget(f"{self.detector}:OD:SUM:Histogram:Low1"),
-            "Low2": int(self._autosave_dict["Low2"])
-            if "Low2" in self._autosave_dict.keys()
-            else await caget(f"{self.detector}:OD:SUM:Histogram:Low2"),
-        }
+        missing = [key for key in HIST_THRESHOLDS if key not in self._autosave_dict]
+        fetched: Dict[str, float] = {}
+        if missing:
+            values = await caget([self._hist_pv[key] for key in missing])
+            fetched = dict(zip(missing, values))
+
+        self._hist_threshold_values: Dict[str, float] = {}
+        for key in HIST_THRESHOLDS:
+            if key in fetched:
+                value = fetched[key]
+            elif key == "High3":
+                value = self._autosave_dict[key]
+            else:
+                value = int(self._autosave_dict[key])
+            self._hist_threshold_values[key] = value
 
         for key, value in self._hist_threshold_values.items():
             self._autosave_dict[key] = value
             self._hist_thresholds[key].set(value, process=True)
 
-    async def _get_hist_thresholds(self) -> None:
-        """
-        Histogram threshold value fetch.
-
-        Fetch the current histogram threshold values from Odin.
-        """
-        non_scaled_hist_thresholds: Dict[str, float] = {
-            "High3": await caget(f"{self.detector}:OD:SUM:Histogram:High3"),
-            "High2": await caget(f"{self.detector}:OD:SUM:Histogram:High2"),
-            "High1": await caget(f"{self.detector}:OD:SUM:Histogram:High1"),
-            "Low1": await caget(f"{self.detector}:OD:SUM:Histogram:Low1"),
-            "Low2": await caget(f"{self.detector}:OD:SUM:Histogram:Low2"),
-        }
-
-        for key, value in non_scaled_hist_thresholds.items():
-            self._autosave_dict[key] = value
-
-    async def _set_hist_thresholds(self, thresholds: Dict[str, int]) -> None:
+    async def _set_hist_thresholds(self, thresholds: Dict[str, float]) -> None:
         """
         Set histogram thresholds.
 
         Args:
-            thresholds (Dict[str, int]): Dictionary of histogram thresholds to set
+            thresholds (Dict[str, float]): Dictionary of histogram thresholds to set
         """
-        for threshold, value in thresholds.items():
-            await caput(
-                f"{self.detector}:OD:SUM:Histogram:{threshold}",
-                value,
-            )
+        await caput(
+            [self._hist_pv[key] for key in thresholds],
+            list(thresholds.values()),
+        )
 
-        self.write_autosave()
+        self._autosave_dirty.set()
 
     async def run_forever(self) -> None:
         """Run asyncio background tasks until program exit."""
@@ -570,13 +752,26 @@ class Wrapper:
         await asyncio.gather(
             *[
                 self.monitor_command_stream(self.zmq_stream),
-                self.monitor_event_stream(self.event_stream),
                 self.zmq_stream.run_forever(),
                 self.event_stream.run_forever(),
                 self._query_status(),
+                self._autosave_flusher(),
             ]
         )
 
+    async def _autosave_flusher(self) -> None:
+        """
+        Write the autosave files once changes have been made.
+
+        Changes made within AUTOSAVE_PERIOD of the first change are written together.
+        The files are written by the autosave writer thread.
+        """
+        while True:
+            await self._autosave_dirty.wait()
+            await asyncio.sleep(self.AUTOSAVE_PERIOD)
+            self._autosave_dirty.clear()
+            self.write_autosave()
+
     async def monitor_command_stream(self, zmq_stream: ZeroMQAdapter) -> None:
         """
         Command stream monitor loop.
@@ -586,52 +781,48 @@ class Wrapper:
         Args:
             zmq_stream (ZeroMQAdapter): Command stream ZeroMQ object
         """
+        get_response = zmq_stream.get_response
+        loads = orjson.loads
+        handle_status = self._handle_status
+        status_recv = self.status_recv
         while True:
             if not zmq_stream.running:
                 print("- Command stream disconnected. Waiting for reconnect...")
-                while not zmq_stream.running:
-                    await asyncio.sleep(1)
+                await zmq_stream.ready.wait()
                 print("- Command stream (re)connected.")
             else:
-                resp: bytes = await zmq_stream.get_response()
-                if resp is not None:
-                    resp_json = json.loads(resp)
+                resp: bytes = await get_response()
+                if not resp or resp[0] != _JSON_OBJECT_START:
+                    continue
+
+                try:
+                    status = loads(resp).get(STATUS_KEY)
+                except orjson.JSONDecodeError as e:
+                    if not self._decode_error_logged:
+                        print(f"~ Invalid response on command stream: {e}")
+                        self._decode_error_logged = True
+                    continue
 
-                    if "status" in resp_json:
-                        if not self.connected:
-                            self.connected = True
-                        status = resp_json["status"]
-                        self._handle_status(status)
-                        self.status_recv = True
+                if status is not None:
+                    if not self.connected:
+                        self.connected = True
+                        self._configured_cache = {}
+                    handle_status(status)
+                    status_recv.set()
 
-    async def monitor_event_stream(self, zmq_stream: ZeroMQAdapter) -> None:
+    def _handle_event(self, resp: bytes) -> None:
         """
-        Event stream monitor loop.
+        Handle a message received on the event stream.
 
-        Loop to forever monitor the event stream for responses.
+        Every message published on the event stream is a frame event, so it is
+        passed to the HDF5 writer without parsing it. Anything that is not a JSON
+        object is dropped.
 
         Args:
-            zmq_stream (ZeroMQAdapter): Event stream ZeroMQ object
+            resp (bytes): Message received on the event stream
         """
-        while True:
-            if not zmq_stream.running:
-                print("- Event stream disconnected. Waiting for reconnect...")
-                while not zmq_stream.running:
-                    await asyncio.sleep(1)
-                print("- Event stream (re)connected.")
-            else:
-                resp: bytes = await zmq_stream.get_response()
-                if resp is not None:
-                    resp_json = json.loads(resp)
-
-                    if "frame_number" in resp_json:
-                        if self.h5f.file_open:
-                            try:
-                                self.h5f._write_to_file(resp_json)
-                            except RuntimeError as e:
-                                print(e)
-                        else:
-                            print("WARNING: HDF5 file not open and frame received.")
+        if resp and resp[0] == _JSON_OBJECT_START:
+            self.h5f.write_frame(resp)
 
     @_if_connected
     def open_file(self, _: int) -> None:
@@ -644,7 +835,7 @@ class Wrapper:
             _ (int): EPICS record processing value
         """
         if _ == 1:
-            self.h5f._open_file()
+            self.h5f.open_file()
 
         if self.file_close.get() != 0:
             self.file_close.set(0, process=False)
@@ -660,34 +851,46 @@ class Wrapper:
             _ (int): EPICS record processing value
         """
         if _ == 1:
-            self.h5f._close_file()
+            self.h5f.close_file()
 
         if self.file_open.get() != 0:
             self.file_open.set(0, process=False)
 
     def _req_status(self) -> None:
         """Send status request command to PowerBrick program."""
-        req_status = b'{"command":"status"}'
-        self._send_message(req_status)
+        self._send_message(_CMD_STATUS)
 
     async def _query_status(self) -> None:
-        """Query the status of the PowerBrick program every 0.1s."""
+        """Query the status of the PowerBrick program every POLL_PERIOD."""
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
         while True:
             if not self.zmq_stream.running:
                 print("Zmq stream not running. waiting...")
-                await asyncio.sleep(1)
+                await self.zmq_stream.ready.wait()
+                next_tick = loop.time()
+                continue
+
+            self.h5f.flush_if_due()
+
+            if self.status_recv.is_set():
+                self.status_recv.clear()
+                self._req_status()
             else:
-                if self.status_recv:
-                    self.status_recv = False
+                print("No status response. Waiting for reconnect...")
+                self.connected = False
+                while not self.status_recv.is_set():
                     self._req_status()
-                else:
-                    print("No status response. Waiting for reconnect...")
-                    self.connected = False
-                    while not self.status_recv:
-                        await asyncio.sleep(1)
-                        self._req_status()
-                    print("Reconnected and status recieved.")
-                await asyncio.sleep(0.1)
+                    try:
+                        await asyncio.wait_for(self.status_recv.wait(), timeout=1)
+                    except asyncio.TimeoutError:
+                        pass
+                print("Reconnected and status recieved.")
+                next_tick = loop.time()
+
+            # Compensate for time spent in this iteration to keep a stable cadence
+            next_tick += self.POLL_PERIOD
+            await asyncio.sleep(max(0, next_tick - loop.time()))
 
     def _handle_status(self, status: Dict[str, int]) -> None:
         """
@@ -696,35 +899,17 @@ class Wrapper:
         Args:
             status (Dict[str, int]): Status dictionary returned from PowerBrick program
         """
-        state = status["state"]
-        if state < 0:
-            state = 16 + state
-        self.state.set(state)
-
-        version = status["version"]
-        self.version.set(str(version))
-
-        process_duration = status["process_duration"]
-        self.process_duration.set(process_duration)
+        for key, record, convert in self._status_records:
+            value = status[key]
+            record.set(value if convert is None else convert(value))
 
-        process_period = status["process_period"]
-        self.process_period.set(process_period)
-
-        last_received_frame = status["last_received_frame"]
-        self.last_frame_received.set(last_received_frame)
-
-        last_processed_frame = status["last_processed_frame"]
-        self.last_frame_processed.set(last_processed_frame)
-
-        time_since_last_frame = status["time_since_last_message"]
-        self.time_since_last_frame.set(time_since_last_frame)
         # Check that at least 1 frame has been received before timing out
-        if time_since_last_frame > self.timeout_rbv.get() and last_received_frame > 1:
+        if (
+            status["time_since_last_message"] > self._timeout
+            and status["last_received_frame"] > 1
+        ):
             self.close_file(1)
 
-        current_attenuation = status["current_attenuation"]
-        self.current_attenuation.set(current_attenuation)
-
     def _send_message(self, message: bytes) -> None:
         """
         Send ZMQ stream message.
@@ -740,11 +925,77 @@ class Wrapper:
         """
         Configure PowerBrick program parameter.
 
+        Any parameters queued by _queue_config are sent in the same message so that
+        they are not applied after this one. Parameters in _CACHED_CONFIG_KEYS are
+        dropped if they are unchanged since they were last sent.
+
         Args:
             param (Dict[str, Union[int, float, Dict[str, int]]]): Parameter to configure
         """
-        configure = json.dumps({"command": "configure", "params": param})
-        self._send_message(codecs.encode(configure, "utf-8"))
+        if self._config_flush_handle is not None:
+            self._config_flush_handle.cancel()
+            self._config_flush_handle = None
+        if self._pending_config:
+            param = {**self._pending_config, **param}
+            self._pending_config = {}
+
+        cache = self._configured_cache
+        unchanged = [
+            key
+            for key, value in param.items()
+            if key in _CACHED_CONFIG_KEYS and cache.get(key) == value
+        ]
+        if unchanged:
+            param = dict(param)
+            for key in unchanged:
+                del param[key]
+            if not param:
+                return
+        for key in _CACHED_CONFIG_KEYS.intersection(param):
+            value = param[key]
+            # Copy dicts, as the pixel count thresholds are updated in place
+            cache[key] = dict(value) if isinstance(value, dict) else value
+
+        if len(param) == 1:
+            ((key, value),) = param.items()
+            if isinstance(value, int):
+                self._send_message(_CMD_CONFIGURE_INT % (key.encode(), value))
+                return
+
+        self._configure_msg["params"] = param
+        configure = orjson.dumps(self._configure_msg)
+        self._send_message(configure)
+
+    def _queue_config(
+        self, param: Dict[str, Union[int, float, Dict[str, int]]]
+    ) -> None:
+        """
+        Queue PowerBrick program parameters to be configured.
+
+        Parameters queued within CONFIG_DEBOUNCE of each other are merged and sent
+        in a single configure message.
+
+        Args:
+            param (Dict[str, Union[int, float, Dict[str, int]]]): Parameter to configure
+        """
+        self._pending_config.update(param)
+
+        if self._config_flush_handle is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                # No loop to schedule on, so send immediately
+                self._flush_config()
+                return
+            self._config_flush_handle = loop.call_later(
+                self.CONFIG_DEBOUNCE, self._flush_config
+            )
+
+    def _flush_config(self) -> None:
+        """Send any queued PowerBrick program parameters."""
+        self._config_flush_handle = None
+        if self._pending_config:
+            self._configure_param({})
 
     @_if_connected
     def _set_mode(self, mode: int) -> None:
@@ -758,12 +1009,13 @@ class Wrapper:
         """
         # Set mode for PFC
         self._configure_param({"mode": mode})
+        self._mode = mode
 
         self.mode_rbv.set(mode)
 
         self.close_file(1)
 
-        if mode == 0:
+        if mode == Mode.MANUAL:
             self.attenuation.set(15)
 
     @_if_connected
@@ -774,7 +1026,7 @@ class Wrapper:
         Args:
             attenuation (int): Attenuation to set
         """
-        if self.state.get() == 0 and self.mode_rbv.get() == 0:
+        if self.state.get() == State.IDLE and self.mode_rbv.get() == Mode.MANUAL:
             # Set manual attenuation for PFC
             self._configure_param({"attenuation": attenuation})
 
@@ -782,7 +1034,7 @@ class Wrapper:
             print("ERROR: Must be in MANUAL mode and IDLE state.")
 
     @_if_connected
-    async def _reset(self, _: int) -> None:
+    def _reset(self, _: int) -> None:
         """
         Reset frame number of PMAC Filter Controller.
 
@@ -790,8 +1042,7 @@ class Wrapper:
             _ (int): EPICS record processing value
         """
         if _ == 1:
-            reset = b'{"command":"reset"}'
-            self._send_message(reset)
+            self._send_message(_CMD_RESET)
 
     @_if_connected
     def _set_timeout(self, timeout: int) -> None:
@@ -803,10 +1054,11 @@ class Wrapper:
         """
         self._configure_param({"timeout": timeout})
 
+        self._timeout = timeout
         self.timeout_rbv.set(timeout)
 
     @_if_connected
-    async def _clear_error(self, _: int) -> None:
+    def _clear_error(self, _: int) -> None:
         """
         Clear error state of PMAC Filter Controller.
 
@@ -814,11 +1066,10 @@ class Wrapper:
             _ (int): EPICS record processing value
         """
         if _ == 1:
-            clear_error = json.dumps({"command": "clear_error"})
-            self._send_message(codecs.encode(clear_error, "utf-8"))
+            self._send_message(_CMD_CLEAR_ERROR)
 
     @_if_connected
-    async def _start_singleshot(self, _: int) -> None:
+    def _start_singleshot(self, _: int) -> None:
         """
         Trigger Singleshot logic in PMAC Filter Controller.
 
@@ -827,10 +1078,11 @@ class Wrapper:
         """
         if _ == 1:
             if (
-                self.state.get() == 3 or self.state.get() == 4
-            ) and self.mode_rbv.get() == 2:
-                start_singleshot = json.dumps({"command": "singleshot"})
-                self._send_message(codecs.encode(start_singleshot, "utf-8"))
+                self.state.get()
+                in (State.SINGLESHOT_WAITING, State.SINGLESHOT_COMPLETE)
+                and self.mode_rbv.get() == Mode.SINGLESHOT
+            ):
+                self._send_message(_CMD_SINGLESHOT)
             else:
                 print(
                     "ERROR: Must be in SINGLESHOT mode, and in \
@@ -852,10 +1104,13 @@ class Wrapper:
 
         await caput(f"{self.motors}:SHUTTER", pos, wait=False, throw=False)
 
-    def _set_shutter_pos(self, val: float, shutter_state: str) -> None:
+    async def _set_shutter_pos(self, val: float, shutter_state: str) -> None:
         """
         Set the shutter position count value.
 
+        If the shutter is currently in the given state, it is moved to the new
+        position.
+
         Args:
             val (float): Count value of the shutter position
             shutter_state (str): The state of the shutter to set the position for
@@ -863,102 +1118,45 @@ class Wrapper:
         if shutter_state == SHUTTER_CLOSED:
             self._configure_param({"shutter_closed_position": val})
 
-        current_shutter_state = "CLOSED" if self.shutter.get() == 0 else "OPEN"
-        if current_shutter_state == shutter_state:
-            self._set_shutter(shutter_state)
+        current_shutter_state = self.shutter.get()
+        # _set_shutter returns without a coroutine to await when not connected
+        if self.connected and SHUTTER_STATES[current_shutter_state] == shutter_state:
+            await self._set_shutter(current_shutter_state)
 
-        self._autosave_dict[f"{self.device_name}:SHUTTER:{shutter_state}"] = val
+        self._autosave_dict[self._shutter_autosave_keys[shutter_state]] = val
 
-        self.write_autosave()
+        self._autosave_dirty.set()
 
     @_if_connected
     def _set_thresholds(self) -> None:
         """Set pixel threshold values for PMAC Filter Controller."""
-        self._configure_param({"pixel_count_thresholds": self.pixel_count_thresholds})
+        self._queue_config(self._threshold_params)
 
-        self.write_autosave()
-
-    @_if_connected
-    def _set_extreme_high_threshold(self, threshold: int) -> None:
-        """
-        Set extreme high pixel threshold value.
-
-        Args:
-            threshold (int): New threshold value
-        """
-        if threshold != self.pixel_count_thresholds["high3"]:
-            self.pixel_count_thresholds["high3"] = threshold
-
-            self._autosave_dict[self.extreme_high_threshold.name] = threshold
-            self._set_thresholds()
-
-    @_if_connected
-    def _set_upper_high_threshold(self, threshold: int) -> None:
-        """
-        Set upper high pixel threshold value.
-
-        Args:
-            threshold (int): New threshold value
-        """
-        if threshold != self.pixel_count_thresholds["high2"]:
-            self.pixel_count_thresholds["high2"] = threshold
-
-            self._autosave_dict[self.upper_high_threshold.name] = threshold
-            self._set_thresholds()
-
-        else:
-            print(f"High 2 is already at value {threshold}.")
-
-    @_if_connected
-    def _set_lower_high_threshold(self, threshold: int) -> None:
-        """
-        Set lower high pixel threshold value.
+        self._autosave_dirty.set()
 
-        Args:
-            threshold (int): New threshold value
+    def _set_pixel_threshold(self, key: str, threshold: int) -> None:
         """
-        if threshold != self.pixel_count_thresholds["high1"]:
-            self.pixel_count_thresholds["high1"] = threshold
-
-            self._autosave_dict[self.lower_high_threshold.name] = threshold
-            self._set_thresholds()
-
-        else:
-            print(f"High 1 is already at value {threshold}.")
+        Set a pixel threshold value.
 
-    @_if_connected
-    def _set_upper_low_threshold(self, threshold: int) -> None:
-        """
-        Set upper low pixel threshold value.
+        The connection is checked inline rather than with _if_connected, as this is
+        called for every threshold record update.
 
         Args:
+            key (str): Key of the threshold in the pixel count thresholds
             threshold (int): New threshold value
         """
-        if threshold != self.pixel_count_thresholds["low2"]:
-            self.pixel_count_thresholds["low2"] = threshold
-
-            self._autosave_dict[self.upper_low_threshold.name] = threshold
-            self._set_thresholds()
-
-        else:
-            print(f"Low 2 is already at value {threshold}.")
+        if not self.connected:
+            print(_NOT_CONNECTED_MSG)
+            return
 
-    @_if_connected
-    def _set_lower_low_threshold(self, threshold: int) -> None:
-        """
-        Set lower low pixel threshold value.
+        if threshold != self.pixel_count_thresholds[key]:
+            self.pixel_count_thresholds[key] = threshold
 
-        Args:
-            threshold (int): New threshold value
-        """
-        if threshold != self.pixel_count_thresholds["low1"]:
-            self.pixel_count_thresholds["low1"] = threshold
-
-            self._autosave_dict[self.lower_low_threshold.name] = threshold
+            self._autosave_dict[self._pixel_threshold_autosave_keys[key]] = threshold
             self._set_thresholds()
 
         else:
-            print(f"Low 1 is already at value {threshold}.")
+            print(f"{key} is already at value {threshold}.")
 
     @_if_connected
     async def _set_hist(self, hist_name: str, hist_val: int) -> None:
@@ -969,32 +1167,29 @@ class Wrapper:
             hist_name (str): Name of the histogram threshold to set
             hist_val (int): Value to set the histogram threshold to
         """
-        self._hist_thresholds[hist_name] = hist_val
         self._autosave_dict[hist_name] = hist_val
-        await caput(
-            f"{self.detector}:OD:SUM:Histogram:{hist_name}",
-            hist_val,
-        )
+        await caput(self._hist_pv[hist_name], hist_val)
 
-        self.write_autosave()
+        self._autosave_dirty.set()
 
     @_if_connected
     async def _set_histogram_scale(self, scale: float) -> None:
         """
         Scale the histogram values by a factor.
 
+        The threshold records and autosave keep the unscaled values, so the scale is
+        always applied to those rather than to the thresholds currently in Odin.
+
         Args:
             scale (float): Scale factor
         """
-        new_thresholds = self._hist_thresholds
+        new_thresholds = {
+            key: record.get() for key, record in self._hist_thresholds.items()
+        }
 
         if scale != 1.0:
-            await self._get_hist_thresholds()
-
-            new_thresholds = {
-                key: threshold * scale
-                for key, threshold in self._hist_thresholds.items()
-            }
+            for key, threshold in new_thresholds.items():
+                new_thresholds[key] = threshold * scale
 
         await self._set_hist_thresholds(new_thresholds)
 
@@ -1006,85 +1201,105 @@ class Wrapper:
         Args:
             filter_set_num (int): Filter set to set positions for
         """
-        in_positions = [
-            x.get()
-            for x in self.filter_sets_in[f"filter_set_{filter_set_num+1}"].values()
-        ]
-        out_positions = [
-            x.get()
-            for x in self.filter_sets_out[f"filter_set_{filter_set_num+1}"].values()
-        ]
+        in_positions = self._in_positions[filter_set_num].tolist()
+        out_positions = self._out_positions[filter_set_num].tolist()
 
-        in_pos = {}
-        for id, pos in enumerate(in_positions):
-            in_pos[f"filter{id+1}"] = pos
+        in_pos = dict(zip(self._filter_keys, in_positions))
+        out_pos = dict(zip(self._filter_keys, out_positions))
 
-        out_pos = {}
-        for id, pos in enumerate(out_positions):
-            out_pos[f"filter{id+1}"] = pos
-
-        # Set filter set positions for PFC
-        self._configure_param({"in_positions": in_pos, "out_positions": out_pos})
+        # Set filter set positions for PFC, skipped if unchanged
+        self._queue_config({"in_positions": in_pos, "out_positions": out_pos})
 
         self.filter_set_rbv.set(filter_set_num)
 
-        if self.mode.get() > 0:
-            self._set_mode(0)
-            self.mode.set(0, process=False)
+        if self._mode != Mode.MANUAL:
+            self._set_mode(Mode.MANUAL)
+            self.mode.set(Mode.MANUAL, process=False)
         else:
             self._set_manual_attenuation(15)
 
-        self._autosave_dict[f"{self.device_name}:FILTER_SET"] = filter_set_num
-        self.write_autosave()
+        self._autosave_dict[self._filter_set_autosave_key] = filter_set_num
+        self._autosave_dirty.set()
 
-    @_if_connected
-    def _set_pos(self, filter_set: int, in_out_key: str, val: float) -> None:
+    def _update_pos(
+        self,
+        positions: np.ndarray,
+        filter_set: int,
+        filter_num: int,
+        autosave_key: str,
+        val: float,
+    ) -> None:
+        """
+        Update the cached position of a filter and set it.
+
+        Args:
+            positions (np.ndarray): Cached in or out positions of all filters
+            filter_set (int): Filter set of the filter
+            filter_num (int): Number of the filter in the filter set
+            autosave_key (str): The autosave key of the filter position record
+            val (float): Position to set the filter position to
+        """
+        positions[filter_set - 1, filter_num - 1] = val
+
+        self._set_pos(filter_set, autosave_key, val)
+
+    def _set_pos(self, filter_set: int, autosave_key: str, val: float) -> None:
         """
         Set position of a filter.
 
+        The connection is checked inline rather than with _if_connected, as this is
+        called for every filter position record update.
+
         Args:
             filter_set (int): Filter set of the filter
-            in_out_key (str): The key to identify the filter in the filter set
+            autosave_key (str): The autosave key of the filter position record
             val (float): Position to set the filter position to
         """
-        self._autosave_dict[f"{self.device_name}:{in_out_key}"] = val
+        if not self.connected:
+            print(_NOT_CONNECTED_MSG)
+            return
+
+        if self._autosave_dict.get(autosave_key) == val:
+            return
+        self._autosave_dict[autosave_key] = val
 
         if self.filter_set_rbv.get() == filter_set - 1:
             self._set_filter_set(filter_set - 1)
 
-        self.write_autosave()
+        self._autosave_dirty.set()
 
-    @_if_connected
     def _set_file_path(self, path: str) -> None:
         """
         Set file path of HDF5 attenuation file.
 
+        This only changes the local HDF5 writer, so it does not need a connection.
+
         Args:
             path (str): File path of HDF5 attenuation file
         """
+        self._file_path = path
         self.file_path_rbv.set(path)
 
         self._combine_file_path_and_name()
 
-    @_if_connected
     def _set_file_name(self, name: str) -> None:
         """
         Set file name of HDF5 attenuation file.
 
+        This only changes the local HDF5 writer, so it does not need a connection.
+
         Args:
             name (str): File name to set
         """
+        self._file_name = name
         self.file_name_rbv.set(name)
 
         self._combine_file_path_and_name()
 
     def _combine_file_path_and_name(self) -> None:
         """Combine the file path and name into a full path."""
-        path: str = self.file_path.get()
-        name = self.file_name.get()
-
-        full_path: str = "/".join([path, name])
+        full_path: str = str(Path(self._file_path) / self._file_name)
 
         self.file_full_name.set(full_path)
 
-        self.h5f._set_file_path(full_path)
+        self.h5f.set_file_path(full_path)
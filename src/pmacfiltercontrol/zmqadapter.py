@@ -1,40 +1,95 @@
 """ZeroMQ adapter for use in a stream device."""
 
 import asyncio
-from dataclasses import dataclass
-from typing import Iterable, List, Optional
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, List, Optional
 
 import aiozmq
 import zmq
 
+_context: Optional[zmq.Context] = None
+
+
+def _get_context(io_threads: int) -> zmq.Context:
+    """
+    Get the ZeroMQ context shared by all adapters, creating it on first use.
+
+    Args:
+        io_threads (int): Number of IO threads to create the context with
+
+    Returns:
+        zmq.Context: The shared ZeroMQ context
+    """
+    global _context
+    if _context is None:
+        _context = zmq.Context(io_threads)
+    return _context
+
+
+class _ZmqCallbackProtocol(aiozmq.ZmqProtocol):
+    """A ZeroMQ protocol passing each received message directly to a callback."""
+
+    def __init__(self, on_recv: Callable[[bytes], None]) -> None:
+        self._on_recv = on_recv
+
+    def msg_received(self, data: List[bytes]) -> None:
+        self._on_recv(data[0])
+
 
 @dataclass
 class ZeroMQAdapter:
-    """An adapter for a ZeroMQ data stream."""
+    """An adapter for a ZeroMQ data stream.
+
+    If on_recv is given, received messages are passed directly to it as they arrive
+    rather than being put on the response queue for get_response.
+
+    All adapters share one ZeroMQ context, created with the io_threads of the first
+    adapter to start.
+
+    The ready event is set while the adapter is running, so it can be awaited
+    rather than polling running.
+    """
 
     zmq_host: str = "127.0.0.1"
     zmq_port: int = 5555
     zmq_type: int = zmq.DEALER
     running: bool = False
+    on_recv: Optional[Callable[[bytes], None]] = None
+    io_threads: int = 2
+    ready: asyncio.Event = field(default_factory=asyncio.Event)
 
     async def start_stream(self) -> None:
         """Start the ZeroMQ stream."""
         print("starting stream...")
 
-        self._socket = await aiozmq.create_zmq_stream(
-            self.zmq_type, connect=f"tcp://{self.zmq_host}:{self.zmq_port}"
-        )  # type: ignore
+        endpoint = f"tcp://{self.zmq_host}:{self.zmq_port}"
+        zmq_sock = _get_context(self.io_threads).socket(self.zmq_type)
+        if self.on_recv is not None:
+            on_recv = self.on_recv
+            self._transport, _ = await aiozmq.create_zmq_connection(
+                lambda: _ZmqCallbackProtocol(on_recv),
+                self.zmq_type,
+                connect=endpoint,
+                zmq_sock=zmq_sock,
+            )  # type: ignore
+            self._socket = None
+        else:
+            self._socket = await aiozmq.create_zmq_stream(
+                self.zmq_type, connect=endpoint, zmq_sock=zmq_sock
+            )  # type: ignore
+            self._transport = self._socket.transport
         if self.zmq_type == zmq.SUB:
-            self._socket.transport.setsockopt(zmq.SUBSCRIBE, b"")
-        self._socket.transport.setsockopt(zmq.LINGER, 0)
+            self._transport.setsockopt(zmq.SUBSCRIBE, b"")
+        self._transport.setsockopt(zmq.LINGER, 0)
 
-        print(f"Stream started. {self._socket}")
+        print(f"Stream started. {self._transport}")
 
     async def close_stream(self) -> None:
         """Close the ZeroMQ stream."""
-        self._socket.close()
+        self._transport.close()
 
         self.running = False
+        self.ready.clear()
 
     def send_message(self, message: List[bytes]) -> None:
         """
@@ -55,6 +110,8 @@ class ZeroMQAdapter:
         Returns:
             Optional[bytes]: If received, a response is returned, else None
         """
+        # Only used without on_recv, in which case start_stream creates a stream
+        assert self._socket is not None
         if self.zmq_type is not zmq.DEALER:
             try:
                 resp = await asyncio.wait_for(self._socket.read(), timeout=20)
@@ -91,14 +148,18 @@ class ZeroMQAdapter:
         self._recv_message_queue: asyncio.Queue = asyncio.Queue()
 
         try:
-            if getattr(self, "_socket", None) is None:
+            if getattr(self, "_transport", None) is None:
                 await self.start_stream()
         except Exception as e:
             print("Exception when starting stream:", e)
 
         self.running = True
+        self.ready.set()
 
-        if self.zmq_type == zmq.DEALER:
+        if self.on_recv is not None:
+            # Messages are handled by the protocol as they are received
+            return
+        elif self.zmq_type == zmq.DEALER:
             await asyncio.gather(
                 *[
                     self._process_message_queue(),
@@ -131,6 +192,8 @@ class ZeroMQAdapter:
         Args:
             message (Iterable[bytes]): Message to send over the ZeroMQ stream.
         """
+        # Only used without on_recv, in which case start_stream creates a stream
+        assert self._socket is not None
         if message is not None:
             if not self._socket._closing:
                 try:
@@ -0,0 +1,178 @@
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Tuple
+
+import h5py
+import numpy as np
+import orjson
+import pytest
+
+from pmacfiltercontrol import hdfadapter
+from pmacfiltercontrol.hdfadapter import (
+    ADJUSTMENT_KEY,
+    ATTENUATION_KEY,
+    BUFFER_SIZE,
+    DATASET_KEYS,
+    FILTERS_MOVING_FLAG_KEY,
+    UID_KEY,
+    HDFAdapter,
+)
+
+# (frame_number, adjustment, attenuation)
+Frame = Tuple[int, int, int]
+
+
+@pytest.fixture
+def file_path(tmp_path: Path) -> Path:
+    return tmp_path / "attenuation.h5"
+
+
+@pytest.fixture
+def adapter(file_path: Path) -> HDFAdapter:
+    adapter = HDFAdapter(str(file_path))
+    adapter.open_file()
+    return adapter
+
+
+def queue_frames(adapter: HDFAdapter, frames: Iterable[Frame]):
+    """Queue the given frames as event stream messages"""
+    for frame_number, adjustment, attenuation in frames:
+        adapter.write_frame(
+            orjson.dumps(
+                {
+                    "frame_number": frame_number,
+                    "adjustment": adjustment,
+                    "attenuation": attenuation,
+                }
+            )
+        )
+
+
+def write_frames(adapter: HDFAdapter, frames: Iterable[Frame]):
+    """Write the given frames as event stream messages and stop the adapter
+
+    Stopping the adapter closes the file once all queued frames are written.
+
+    """
+    queue_frames(adapter, frames)
+    adapter.stop()
+
+
+def wait_for_writer(adapter: HDFAdapter):
+    """Wait until all operations queued for the writer thread are done"""
+    done = threading.Event()
+    adapter._writer_q.put_nowait((done.set, ()))
+    assert done.wait(timeout=5)
+
+
+def read_datasets(file_path: Path) -> Dict[str, np.ndarray]:
+    with h5py.File(file_path, "r") as f:
+        return {key: f[key][()] for key in DATASET_KEYS}
+
+
+def assert_frames_written(datasets: Dict[str, np.ndarray], frames: Iterable[Frame]):
+    """Check the datasets hold the expected values for each of the given frames"""
+    for frame_number, adjustment, attenuation in frames:
+        filters_moving = (adjustment < 0 and attenuation > 0) or (
+            adjustment > 0 and attenuation < 15
+        )
+        assert datasets[ADJUSTMENT_KEY][frame_number] == adjustment
+        assert datasets[ATTENUATION_KEY][frame_number] == attenuation
+        assert datasets[UID_KEY][frame_number] == frame_number + 1
+        assert datasets[FILTERS_MOVING_FLAG_KEY][frame_number] == filters_moving
+
+
+def test_contiguous_frames(adapter: HDFAdapter, file_path: Path):
+    frames = [(0, 0, 15), (1, -1, 15), (2, -1, 14), (3, 1, 13), (4, 1, 15)]
+    write_frames(adapter, frames)
+
+    datasets = read_datasets(file_path)
+    for key in DATASET_KEYS:
+        assert datasets[key].shape == (len(frames),)
+    assert_frames_written(datasets, frames)
+
+
+def test_frames_with_gaps(adapter: HDFAdapter, file_path: Path):
+    frames = [(5, 0, 15), (6, -1, 15), (9, -2, 13), (2000, 3, 10)]
+    write_frames(adapter, frames)
+
+    datasets = read_datasets(file_path)
+    for key in DATASET_KEYS:
+        assert datasets[key].shape == (2001,)
+    assert_frames_written(datasets, frames)
+
+    # Frames that were never received are left at the fill value
+    written = [frame_number for frame_number, _, _ in frames]
+    missing = np.setdiff1d(np.arange(2001), written)
+    for key in DATASET_KEYS:
+        assert not datasets[key][missing].any()
+
+
+def test_more_frames_than_buffer(adapter: HDFAdapter, file_path: Path):
+    frame_count = 2 * BUFFER_SIZE + 10
+    frames = [(n, (n % 3) - 1, n % 16) for n in range(frame_count)]
+    write_frames(adapter, frames)
+
+    datasets = read_datasets(file_path)
+    for key in DATASET_KEYS:
+        assert datasets[key].shape == (frame_count,)
+    assert_frames_written(datasets, frames)
+
+
+def test_streamed_frames_are_written_after_flush_period(
+    adapter: HDFAdapter, file_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setattr(hdfadapter, "FLUSH_PERIOD", 0.05)
+    frames = [(0, 0, 15), (1, -1, 15), (2, -1, 14)]
+    queue_frames(adapter, frames[:2])
+    wait_for_writer(adapter)
+    time.sleep(0.1)
+    # Frames keep arriving, so the buffer is never idle
+    queue_frames(adapter, frames[2:])
+    wait_for_writer(adapter)
+
+    try:
+        with h5py.File(file_path, "r", libver="latest", swmr=True) as f:
+            datasets = {key: f[key][()] for key in DATASET_KEYS}
+    finally:
+        adapter.stop()
+
+    # Only the frames received are visible, with no padding beyond them
+    for key in DATASET_KEYS:
+        assert datasets[key].shape == (len(frames),)
+    assert_frames_written(datasets, frames)
+
+
+def test_no_frames(adapter: HDFAdapter, file_path: Path):
+    write_frames(adapter, [])
+
+    datasets = read_datasets(file_path)
+    for key in DATASET_KEYS:
+        assert datasets[key].shape == (0,)
+
+
+def test_set_file_path_is_applied_in_order(tmp_path: Path):
+    adapter = HDFAdapter(str(tmp_path / "first.h5"))
+    new_file_path = tmp_path / "second.h5"
+    adapter.set_file_path(str(new_file_path))
+    adapter.open_file()
+    frames = [(0, 0, 15), (1, -1, 15)]
+    write_frames(adapter, frames)
+
+    assert not (tmp_path / "first.h5").exists()
+    assert_frames_written(read_datasets(new_file_path), frames)
+
+
+@pytest.mark.parametrize(
+    "bad_path",
+    ["", "attenuation.h5", "{tmp_path}", "{tmp_path}/missing/attenuation.h5"],
+)
+def test_invalid_file_path_is_rejected(tmp_path: Path, bad_path: str):
+    adapter = HDFAdapter()
+    adapter.set_file_path(bad_path.format(tmp_path=tmp_path))
+    adapter.open_file()
+    adapter.stop()
+
+    assert adapter.file_path == ""
+    assert not list(tmp_path.iterdir())
@@ -13,6 +13,7 @@ from pmacfiltercontrol.detector_sim import DetectorSim
 from pmacfiltercontrol.event_subscriber import EventSubscriber
 
 DEFAULT_TIMEOUT_MS = 1000
+STOP_TIMEOUT_S = 5
 
 
 HERE = Path(__file__).parent
@@ -138,8 +139,19 @@ class PMACFilterControlWrapper:
         sleep(0.1)  # Allow the application state to update
 
     def stop(self):
+        """Stop the application and wait for it to exit so its ports are released
+
+        The application is sent SIGTERM first, and SIGKILL if it has not exited
+        within half of the stop timeout.
+
+        """
         print("Stopping pmacFilterControl")
-        self.process.kill()
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=STOP_TIMEOUT_S / 2)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait(timeout=STOP_TIMEOUT_S / 2)
 
 
 @pytest.fixture
@@ -0,0 +1,143 @@
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Union
+
+import pytest
+from softioc import builder
+
+from pmacfiltercontrol import pmacFilterControlWrapper
+from pmacfiltercontrol.pmacFilterControlWrapper import (
+    HIST_THRESHOLDS,
+    SHUTTER_OPEN,
+    Wrapper,
+)
+
+DEVICE_NAME = "TEST-PFC"
+
+
+def create_wrapper(tmp_path: Path) -> Wrapper:
+    builder.SetDeviceName(DEVICE_NAME)
+    wrapper = Wrapper(
+        "127.0.0.1",
+        9000,
+        9001,
+        builder,
+        DEVICE_NAME,
+        6,
+        4,
+        "DET",
+        "MOTORS",
+        str(tmp_path / "autosave.txt"),
+        str(tmp_path),
+    )
+    wrapper.connected = True
+    return wrapper
+
+
+def stop_wrapper(wrapper: Wrapper):
+    """Stop the wrapper's writer threads and delete its records"""
+    wrapper.stop_autosave()
+    wrapper.h5f.stop()
+    builder.ClearRecords()
+
+
+@pytest.fixture
+def wrapper(tmp_path: Path) -> Iterator[Wrapper]:
+    wrapper = create_wrapper(tmp_path)
+    yield wrapper
+    stop_wrapper(wrapper)
+
+
+@pytest.fixture
+def pvs(monkeypatch: pytest.MonkeyPatch) -> Dict[str, float]:
+    """Replace caget/caput with fakes reading and writing the returned PV values"""
+    pvs: Dict[str, float] = {}
+
+    async def caget(names: List[str]) -> List[float]:
+        return [pvs[name] for name in names]
+
+    async def caput(names: Union[str, List[str]], values: Any, **kwargs) -> None:
+        if isinstance(names, str):
+            pvs[names] = values
+        else:
+            pvs.update(zip(names, values))
+
+    monkeypatch.setattr(pmacFilterControlWrapper, "caget", caget)
+    monkeypatch.setattr(pmacFilterControlWrapper, "caput", caput)
+    return pvs
+
+
+def wait_for_hdf_writer(wrapper: Wrapper):
+    """Wait until all operations queued for the HDF5 writer thread are done"""
+    done = threading.Event()
+    wrapper.h5f._writer_q.put_nowait((done.set, ()))
+    assert done.wait(timeout=5)
+
+
+def test_full_file_name_shows_rejected_path(wrapper: Wrapper, tmp_path: Path):
+    valid_path = str(tmp_path / "attenuation.h5")
+    invalid_path = str(tmp_path / "missing" / "attenuation.h5")
+
+    wrapper._set_file_path(str(tmp_path))
+    wait_for_hdf_writer(wrapper)
+    assert wrapper.h5f.file_path == valid_path
+
+    wrapper._set_file_path(str(tmp_path / "missing"))
+    wait_for_hdf_writer(wrapper)
+    assert wrapper.file_full_name.get() == invalid_path
+    assert wrapper.h5f.file_path == valid_path
+
+    wrapper._set_file_path(str(tmp_path))
+    wait_for_hdf_writer(wrapper)
+    assert wrapper.file_full_name.get() == valid_path
+    assert wrapper.h5f.file_path == valid_path
+
+
+def test_file_name_set_while_disconnected_is_used(wrapper: Wrapper, tmp_path: Path):
+    wrapper.connected = False
+    wrapper._set_file_name("disconnected.h5")
+    wrapper.connected = True
+    wrapper._set_file_path(str(tmp_path))
+    wait_for_hdf_writer(wrapper)
+
+    assert wrapper.file_full_name.get() == str(tmp_path / "disconnected.h5")
+    assert wrapper.h5f.file_path == str(tmp_path / "disconnected.h5")
+
+
+@pytest.mark.asyncio
+async def test_histogram_scale_is_not_compounded_after_restart(
+    tmp_path: Path, pvs: Dict[str, float]
+):
+    base = {key: 10.0 * (i + 1) for i, key in enumerate(HIST_THRESHOLDS)}
+    pvs.update({f"DET:OD:SUM:Histogram:{key}": value for key, value in base.items()})
+
+    wrapper = create_wrapper(tmp_path)
+    await wrapper._setup_hist_thresholds()
+    await wrapper._set_histogram_scale(2.0)
+    await wrapper._set_histogram_scale(2.0)
+    stop_wrapper(wrapper)
+
+    wrapper = create_wrapper(tmp_path)
+    try:
+        await wrapper._setup_hist_thresholds()
+        await wrapper._set_histogram_scale(2.0)
+    finally:
+        stop_wrapper(wrapper)
+
+    for key, value in base.items():
+        assert pvs[f"DET:OD:SUM:Histogram:{key}"] == value * 2
+
+
+@pytest.mark.asyncio
+async def test_shutter_moves_to_new_position_of_current_state(
+    wrapper: Wrapper, pvs: Dict[str, float]
+):
+    wrapper.shutter.set(0, process=False)  # CLOSED
+    wrapper.shutter_pos_open.set(100.0, process=False)
+    await wrapper._set_shutter_pos(100.0, SHUTTER_OPEN)
+    assert "MOTORS:SHUTTER" not in pvs
+
+    wrapper.shutter.set(1, process=False)  # OPEN
+    wrapper.shutter_pos_open.set(200.0, process=False)
+    await wrapper._set_shutter_pos(200.0, SHUTTER_OPEN)
+    assert pvs["MOTORS:SHUTTER"] == 200.0